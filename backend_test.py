@@ -3,6 +3,7 @@
 import requests
 import sys
 import json
+import time
 from datetime import datetime, timedelta
 
 class HostelFoodAPITester:
@@ -168,6 +169,22 @@ class HostelFoodAPITester:
             print(f"   Found {len(response)} menu items")
         return success
 
+    def test_update_menu_item(self):
+        """Test editing a menu item"""
+        if not self.created_items:
+            print("❌ No menu items available to update")
+            return False
+            
+        success, response = self.run_test(
+            "Update Menu Item",
+            "PATCH",
+            f"admin/menu-items/{self.created_items[0]}",
+            200,
+            data={"description": "Soft idlis with sambar and chutney"},
+            token=self.admin_token
+        )
+        return success
+
     def test_create_menu(self):
         """Test creating/publishing menus"""
         if not self.created_items:
@@ -220,6 +237,31 @@ class HostelFoodAPITester:
             print(f"   Found {len(response)} menus")
         return success
 
+    def test_conditional_get(self):
+        """Test ETag revalidation on the admin menu list"""
+        url = f"{self.base_url}/api/admin/menus"
+        headers = {'Authorization': f'Bearer {self.admin_token}'}
+        
+        self.tests_run += 1
+        print(f"\n🔍 Testing Conditional GET (ETag)...")
+        print(f"   URL: GET {url}")
+        try:
+            first = requests.get(url, headers=headers)
+            etag = first.headers.get('ETag')
+            if first.status_code != 200 or not etag:
+                print(f"❌ Failed - Expected 200 with ETag, got {first.status_code} ({etag})")
+                return False
+            second = requests.get(url, headers={**headers, 'If-None-Match': etag})
+            if second.status_code != 304:
+                print(f"❌ Failed - Expected 304, got {second.status_code}")
+                return False
+            self.tests_passed += 1
+            print(f"✅ Passed - Status: 304 ({len(second.content)} bytes)")
+            return True
+        except Exception as e:
+            print(f"❌ Failed - Error: {str(e)}")
+            return False
+
     def test_student_get_menus(self):
         """Test student getting available menus"""
         success, response = self.run_test(
@@ -312,6 +354,20 @@ class HostelFoodAPITester:
             
         return success1 and success2
 
+    def test_ticket_search(self):
+        """Test admin full-text ticket search"""
+        success, response = self.run_test(
+            "Search Tickets",
+            "GET",
+            "admin/tickets/search",
+            200,
+            token=self.admin_token,
+            params={"q": "salty"}
+        )
+        if success:
+            print(f"   {response.get('total', 0)} hits, facets: {response.get('facets', {}).get('status', {})}")
+        return success
+
     def test_update_ticket_status(self):
         """Test admin updating ticket status"""
         if not self.created_tickets:
@@ -327,6 +383,27 @@ class HostelFoodAPITester:
         )
         return success
 
+    def test_bulk_ticket_status(self):
+        """Test bulk ticket triage"""
+        if not self.created_tickets:
+            print("❌ No tickets available to update")
+            return False
+            
+        success, response = self.run_test(
+            "Bulk Update Ticket Status",
+            "POST",
+            "admin/tickets/bulk-status",
+            200,
+            data={"updates": [
+                {"ticket_id": self.created_tickets[0], "status": "closed"},
+                {"ticket_id": "missing-ticket", "status": "closed"}
+            ]},
+            token=self.admin_token
+        )
+        if success:
+            print(f"   Summary: {response.get('summary', {})}")
+        return success
+
     def test_menu_analytics(self):
         """Test getting menu analytics"""
         if not self.created_menus:
@@ -346,6 +423,82 @@ class HostelFoodAPITester:
             print(f"   Analytics: {total_users} users, {total_selections} selections")
         return success
 
+    def wait_for_analytics(self, menu_id, expected, attempts=10):
+        """Poll analytics until item counts match; selections may be flushed write-behind"""
+        response = {}
+        for _ in range(attempts):
+            response = requests.get(
+                f"{self.base_url}/api/admin/analytics/{menu_id}",
+                headers={'Authorization': f'Bearer {self.admin_token}'}
+            ).json()
+            counts = {item['item_id']: item['count'] for item in response.get('items', [])}
+            if response.get('total_users') == expected['total_users'] and counts == expected['items']:
+                return True, response
+            time.sleep(0.5)
+        return False, response
+
+    def test_selection_counters(self):
+        """Test analytics counters follow a selection being created and then changed"""
+        if len(self.created_items) < 2:
+            print("❌ Need two menu items for counter test")
+            return False
+        first, second = self.created_items[0], self.created_items[1]
+        tomorrow = (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')
+        success, menu = self.run_test(
+            "Create Menu For Counters",
+            "POST",
+            "admin/menus",
+            200,
+            data={"date": tomorrow, "meal_type": "dinner", "item_ids": [first, second]},
+            token=self.admin_token
+        )
+        if not success:
+            return False
+        self.created_menus.append(menu['id'])
+        
+        steps = [
+            ("Counters After Create", [first], {first: 1, second: 0}),
+            ("Counters After Change", [second], {first: 0, second: 1})
+        ]
+        for name, selected, expected_items in steps:
+            success, _ = self.run_test(
+                f"Submit Selection {selected}",
+                "POST",
+                "student/selections",
+                200,
+                data={"menu_id": menu['id'], "selected_item_ids": selected},
+                token=self.student_token
+            )
+            if not success:
+                return False
+            
+            self.tests_run += 1
+            print(f"\n🔍 Testing {name}...")
+            matched, response = self.wait_for_analytics(menu['id'], {'total_users': 1, 'items': expected_items})
+            if not matched:
+                counts = {item['item_id']: item['count'] for item in response.get('items', [])}
+                print(f"❌ Failed - Expected 1 user and {expected_items}, got {response.get('total_users')} and {counts}")
+                return False
+            self.tests_passed += 1
+            print(f"✅ Passed - 1 user, counts {expected_items}")
+        return True
+
+    def test_range_analytics(self):
+        """Test batch analytics over a date range"""
+        today = datetime.now().strftime('%Y-%m-%d')
+        tomorrow = (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')
+        success, response = self.run_test(
+            "Get Range Analytics",
+            "GET",
+            "admin/analytics",
+            200,
+            token=self.admin_token,
+            params={"start_date": today, "end_date": tomorrow, "meal_types": "breakfast,lunch,dinner"}
+        )
+        if success:
+            print(f"   Analytics for {len(response.get('menus', []))} menus")
+        return success
+
     def test_unauthorized_access(self):
         """Test unauthorized access to admin endpoints"""
         success, response = self.run_test(
@@ -357,6 +510,85 @@ class HostelFoodAPITester:
         )
         return success
 
+    def test_metrics(self):
+        """Test the Prometheus scrape endpoint"""
+        url = f"{self.base_url}/metrics"
+        
+        self.tests_run += 1
+        print(f"\n🔍 Testing Prometheus Metrics...")
+        print(f"   URL: GET {url}")
+        try:
+            response = requests.get(url)
+            if response.status_code != 200:
+                print(f"❌ Failed - Expected 200, got {response.status_code}")
+                return False
+            for series in ('http_request_duration_seconds_bucket', 'mongodb_command_duration_seconds_bucket', 'threadpool_queue_depth'):
+                if series not in response.text:
+                    print(f"❌ Failed - Missing series {series}")
+                    return False
+            self.tests_passed += 1
+            print(f"✅ Passed - Status: 200 ({len(response.text.splitlines())} lines)")
+            return True
+        except Exception as e:
+            print(f"❌ Failed - Error: {str(e)}")
+            return False
+
+    def test_slow_queries(self):
+        """Test the slow query top offenders listing"""
+        success, response = self.run_test(
+            "Slow Query Offenders",
+            "GET",
+            "admin/slow-queries",
+            200,
+            token=self.admin_token,
+            params={"hours": 1}
+        )
+        if success:
+            print(f"   Enabled: {response.get('enabled')}, shapes: {len(response.get('offenders', []))}")
+        return success
+
+    def test_request_profiling(self):
+        """Test per-request profiling via a signed X-Profile-Token"""
+        success, token = self.run_test(
+            "Create Profiler Token",
+            "POST",
+            "admin/profiler/token",
+            200,
+            token=self.admin_token
+        )
+        if not success:
+            return False
+        
+        url = f"{self.base_url}/api/auth/me"
+        self.tests_run += 1
+        print(f"\n🔍 Testing Profiled Request...")
+        print(f"   URL: GET {url}")
+        try:
+            response = requests.get(url, headers={
+                'Authorization': f'Bearer {self.admin_token}',
+                token['header']: token['token']
+            })
+            profile_id = response.headers.get('X-Profile-Id')
+            if response.status_code != 200 or not profile_id:
+                print(f"❌ Failed - Expected 200 with X-Profile-Id, got {response.status_code} ({profile_id})")
+                return False
+            self.tests_passed += 1
+            print(f"✅ Passed - Profile: {profile_id}")
+        except Exception as e:
+            print(f"❌ Failed - Error: {str(e)}")
+            return False
+        
+        success, profile = self.run_test(
+            "Get Request Profile",
+            "GET",
+            f"admin/profiler/requests/{profile_id}",
+            200,
+            token=self.admin_token
+        )
+        if success:
+            print(f"   Samples: {profile.get('samples')}, duration: {profile.get('duration_ms')}ms")
+        return success
+
     def cleanup(self):
         """Clean up created test data"""
         print(f"\n🧹 Cleaning up test data...")
@@ -400,9 +632,12 @@ def main():
         
         tester.test_create_menu_item()
         tester.test_get_menu_items()
+        tester.test_update_menu_item()
         tester.test_create_menu()
         tester.test_get_menus()
+        tester.test_conditional_get()
         tester.test_menu_analytics()
+        tester.test_range_analytics()
         
         # Student Functionality Tests
         print("\n📋 STUDENT FUNCTIONALITY TESTS")
@@ -411,6 +646,7 @@ def main():
         tester.test_student_get_menus()
         tester.test_meal_selection()
         tester.test_booking_history()
+        tester.test_selection_counters()
         
         # Ticket System Tests
         print("\n📋 TICKET SYSTEM TESTS")
@@ -418,7 +654,17 @@ def main():
         
         tester.test_create_ticket()
         tester.test_get_tickets()
+        tester.test_ticket_search()
         tester.test_update_ticket_status()
+        tester.test_bulk_ticket_status()
+        
+        # Observability Tests
+        print("\n📋 OBSERVABILITY TESTS")
+        print("-" * 30)
+        
+        tester.test_metrics()
+        tester.test_slow_queries()
+        tester.test_request_profiling()
         
         # Security Tests
         print("\n📋 SECURITY TESTS")
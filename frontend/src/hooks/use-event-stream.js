@@ -0,0 +1,65 @@
+import { useEffect, useRef } from "react";
+import axios from "axios";
+import { API, useAuth } from "../contexts/AuthContext";
+
+const RECONNECT_DELAY_MS = 5000;
+
+// Subscribe to server-sent events. `handlers` maps event types
+// (e.g. "ticket.created", "menu.published", "resync") to callbacks.
+// EventSource can't send headers, so each connection uses a short-lived
+// stream token instead of putting the session JWT in the URL.
+export function useEventStream(handlers) {
+  const { token } = useAuth();
+  const handlersRef = useRef(handlers);
+  handlersRef.current = handlers;
+
+  useEffect(() => {
+    if (!token || typeof EventSource === "undefined") return undefined;
+
+    let source = null;
+    let reconnectTimer = null;
+    let cancelled = false;
+
+    const scheduleReconnect = () => {
+      if (!cancelled) reconnectTimer = setTimeout(connect, RECONNECT_DELAY_MS);
+    };
+
+    const connect = async () => {
+      let streamToken;
+      try {
+        const response = await axios.post(`${API}/events/token`, {}, {
+          headers: { Authorization: `Bearer ${token}` }
+        });
+        streamToken = response.data.token;
+      } catch (error) {
+        scheduleReconnect();
+        return;
+      }
+      if (cancelled) return;
+
+      source = new EventSource(`${API}/events/stream?token=${encodeURIComponent(streamToken)}`);
+      Object.keys(handlersRef.current).forEach((type) => {
+        source.addEventListener(type, (event) => {
+          const handler = handlersRef.current[type];
+          if (handler) handler(event.data ? JSON.parse(event.data) : {});
+        });
+      });
+      // The browser retries dropped streams with the same URL; once the stream
+      // token has expired that retry is rejected and the source closes for good
+      source.onerror = () => {
+        if (source.readyState === EventSource.CLOSED) {
+          source = null;
+          scheduleReconnect();
+        }
+      };
+    };
+
+    connect();
+
+    return () => {
+      cancelled = true;
+      clearTimeout(reconnectTimer);
+      if (source) source.close();
+    };
+  }, [token]);
+}
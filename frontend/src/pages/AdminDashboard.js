@@ -1,6 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { useAuth, API } from '../contexts/AuthContext';
+import { useEventStream } from '../hooks/use-event-stream';
 
 const COLORS = ['#F97316', '#0F172A', '#22C55E', '#3B82F6', '#A855F7', '#EC4899'];
 
@@ -9,13 +10,20 @@ export default function AdminDashboard() {
   const { user, logout, token } = useAuth();
   const [menus, setMenus] = useState([]);
   const [selectedMenuAnalytics, setSelectedMenuAnalytics] = useState(null);
-  const [tickets, setTickets] = useState([]);
+  const [openTickets, setOpenTickets] = useState(0);
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
     fetchData();
   }, []);
 
+  useEventStream({
+    'ticket.created': () => fetchData(),
+    'ticket.updated': () => fetchData(),
+    'menu.published': () => fetchData(),
+    resync: () => fetchData()
+  });
+
   const fetchData = async () => {
     try {
       const [menusRes, ticketsRes] = await Promise.all([
@@ -23,12 +31,14 @@ export default function AdminDashboard() {
           headers: { Authorization: `Bearer ${token}` }
         }),
         axios.get(`${API}/tickets`, {
-          headers: { Authorization: `Bearer ${token}` }
+          headers: { Authorization: `Bearer ${token}` },
+          // Only the count is shown; the server totals every open ticket
+          params: { status: 'open', limit: 1, with_total: true }
         })
       ]);
       
       setMenus(menusRes.data);
-      setTickets(ticketsRes.data);
+      setOpenTickets(Number(ticketsRes.headers['x-total-count'] ?? ticketsRes.data.length));
       
       // Load analytics for first menu
       if (menusRes.data.length > 0) {
@@ -52,7 +62,6 @@ export default function AdminDashboard() {
     }
   };
 
-  const openTickets = tickets.filter(t => t.status === 'open').length;
   const totalMenus = menus.length;
 
   return (
@@ -1,6 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { useAuth } from '../contexts/AuthContext';
+import { useEventStream } from '../hooks/use-event-stream';
 import axios from 'axios';
 import { ArrowLeft, CheckCircle, XCircle, Clock, Image as ImageIcon } from 'lucide-react';
 import { toast } from 'sonner';
@@ -13,21 +14,30 @@ export default function AdminTicketsPage() {
   const { token } = useAuth();
   const [tickets, setTickets] = useState([]);
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [photos, setPhotos] = useState({});
 
   useEffect(() => {
     fetchTickets();
   }, []);
 
-  const fetchTickets = async () => {
+  // Apply ticket deltas in place so pages loaded with "Load more" are kept
+  useEventStream({
+    'ticket.created': (ticket) =>
+      setTickets((prev) => (prev.some((t) => t.id === ticket.id) ? prev : [ticket, ...prev])),
+    'ticket.updated': ({ id, status }) =>
+      setTickets((prev) => prev.map((t) => (t.id === id ? { ...t, status } : t))),
+    resync: () => fetchTickets()
+  });
+
+  const fetchTickets = async (before = null) => {
     try {
       const response = await axios.get(`${API}/tickets`, {
-        headers: { Authorization: `Bearer ${token}` }
+        headers: { Authorization: `Bearer ${token}` },
+        params: before ? { before } : {}
       });
-      console.log('Tickets data:', response.data);
-      response.data.forEach((ticket, i) => {
-        console.log(`Ticket ${i} photos:`, ticket.photos);
-      });
-      setTickets(response.data);
+      setTickets((prev) => (before ? [...prev, ...response.data] : response.data));
+      setNextCursor(response.headers['x-next-cursor'] || null);
     } catch (error) {
       toast.error('Failed to load tickets');
     } finally {
@@ -35,6 +45,21 @@ export default function AdminTicketsPage() {
     }
   };
 
+  const loadPhotos = async (ticketId) => {
+    try {
+      const response = await axios.get(`${API}/tickets/${ticketId}`, {
+        headers: { Authorization: `Bearer ${token}` }
+      });
+      // Older tickets hold inline data URLs; newer ones hold attachment blob ids
+      const urls = (response.data.photos || []).map(photo =>
+        photo.startsWith('data:') ? photo : `${API}/tickets/attachments/${photo}`
+      );
+      setPhotos((prev) => ({ ...prev, [ticketId]: urls }));
+    } catch (error) {
+      toast.error('Failed to load photos');
+    }
+  };
+
   const updateTicketStatus = async (ticketId, status) => {
     try {
       await axios.patch(
@@ -43,7 +68,7 @@ export default function AdminTicketsPage() {
         { headers: { Authorization: `Bearer ${token}` } }
       );
       toast.success('Ticket status updated');
-      fetchTickets();
+      setTickets((prev) => prev.map((t) => (t.id === ticketId ? { ...t, status } : t)));
     } catch (error) {
       toast.error('Failed to update ticket');
     }
@@ -154,16 +179,24 @@ export default function AdminTicketsPage() {
                 </div>
 
                 {/* Photos Section */}
-                {ticket.photos && ticket.photos.length > 0 && (
+                {ticket.photo_count > 0 && (
                   <div className="mb-4">
                     <div className="flex items-center gap-2 mb-3">
                       <ImageIcon className="w-4 h-4 text-slate-400" />
                       <p className="text-xs font-bold text-slate-400 uppercase tracking-wider">
-                        Attached Photos ({ticket.photos.length})
+                        Attached Photos ({ticket.photo_count})
                       </p>
+                      {!photos[ticket.id] && (
+                        <button
+                          onClick={() => loadPhotos(ticket.id)}
+                          className="text-xs font-bold text-orange-500 hover:text-orange-600"
+                        >
+                          Show
+                        </button>
+                      )}
                     </div>
                     <div className="grid grid-cols-2 sm:grid-cols-3 md:grid-cols-4 gap-3">
-                      {ticket.photos.map((photo, index) => (
+                      {(photos[ticket.id] || []).map((photo, index) => (
                         <div key={index} className="relative group">
                           <img
                             src={photo}
@@ -208,6 +241,16 @@ export default function AdminTicketsPage() {
             ))}
           </div>
         )}
+        {!loading && nextCursor && (
+          <div className="flex justify-center mt-8">
+            <button
+              onClick={() => fetchTickets(nextCursor)}
+              className="px-6 py-2 bg-white border border-slate-200 rounded-lg text-sm font-medium text-slate-700 hover:border-orange-300 transition-all"
+            >
+              Load more
+            </button>
+          </div>
+        )}
       </main>
     </div>
   );
@@ -13,17 +13,21 @@ export default function BookingHistoryPage() {
   const { token } = useAuth();
   const [history, setHistory] = useState([]);
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   useEffect(() => {
     fetchHistory();
   }, []);
 
-  const fetchHistory = async () => {
+  const fetchHistory = async (before = null) => {
     try {
       const response = await axios.get(`${API}/student/booking-history`, {
-        headers: { Authorization: `Bearer ${token}` }
+        headers: { Authorization: `Bearer ${token}` },
+        params: before ? { before } : {}
       });
-      setHistory(response.data);
+      setHistory((prev) => (before ? [...prev, ...response.data] : response.data));
+      setNextCursor(response.headers['x-next-cursor'] || null);
     } catch (error) {
       toast.error('Failed to load booking history');
     } finally {
@@ -31,6 +35,12 @@ export default function BookingHistoryPage() {
     }
   };
 
+  const loadMore = async () => {
+    setLoadingMore(true);
+    await fetchHistory(nextCursor);
+    setLoadingMore(false);
+  };
+
   return (
     <div className="min-h-screen bg-[#FAFAFA]">
       <header className="bg-white border-b border-slate-100 sticky top-0 z-40">
@@ -112,6 +122,17 @@ export default function BookingHistoryPage() {
             ))}
           </div>
         )}
+        {!loading && nextCursor && (
+          <div className="flex justify-center mt-10">
+            <button
+              onClick={loadMore}
+              disabled={loadingMore}
+              className="bg-white border border-slate-200 text-[#0F172A] px-8 py-3 rounded-2xl font-bold hover:border-orange-500 hover:text-orange-500 transition-all disabled:opacity-50"
+            >
+              {loadingMore ? 'Loading...' : 'Load more'}
+            </button>
+          </div>
+        )}
       </main>
     </div>
   );
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useNavigate, useLocation } from 'react-router-dom';
 import { useAuth } from '../contexts/AuthContext';
 import axios from 'axios';
@@ -8,6 +8,12 @@ import { format } from 'date-fns';
 
 const API = `${process.env.REACT_APP_BACKEND_URL}/api`;
 
+// crypto.randomUUID only exists in secure contexts; plain-HTTP deploys use the fallback
+const newIdempotencyKey = () =>
+  window.crypto?.randomUUID
+    ? window.crypto.randomUUID()
+    : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}${Math.random().toString(36).slice(2)}`;
+
 export default function MealSelectionPage() {
   const navigate = useNavigate();
   const location = useLocation();
@@ -17,11 +23,17 @@ export default function MealSelectionPage() {
   const [selectedItems, setSelectedItems] = useState([]);
   const [loading, setLoading] = useState(true);
   const [submitting, setSubmitting] = useState(false);
+  // One key per pending submission so retries and double-clicks are deduplicated
+  const idempotencyKey = useRef(null);
 
   useEffect(() => {
     fetchMenus();
   }, []);
 
+  useEffect(() => {
+    idempotencyKey.current = null;
+  }, [selectedMenu?.id, selectedItems]);
+
   useEffect(() => {
     if (location.state?.selectedMenu) {
       const menu = location.state.selectedMenu;
@@ -73,6 +85,10 @@ export default function MealSelectionPage() {
       return;
     }
 
+    if (!idempotencyKey.current) {
+      idempotencyKey.current = newIdempotencyKey();
+    }
+
     setSubmitting(true);
     try {
       await axios.post(
@@ -81,7 +97,12 @@ export default function MealSelectionPage() {
           menu_id: selectedMenu.id,
           selected_item_ids: selectedItems
         },
-        { headers: { Authorization: `Bearer ${token}` } }
+        {
+          headers: {
+            Authorization: `Bearer ${token}`,
+            'Idempotency-Key': idempotencyKey.current
+          }
+        }
       );
       toast.success('Meal booked successfully!');
       navigate('/dashboard');
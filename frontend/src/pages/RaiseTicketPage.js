@@ -59,24 +59,22 @@ export default function RaiseTicketPage() {
 
     setSubmitting(true);
     try {
-      // Convert selected files to base64
-      const photoPromises = selectedFiles.map(fileObj => {
-        return new Promise((resolve, reject) => {
-          const reader = new FileReader();
-          reader.onloadend = () => resolve(reader.result);
-          reader.onerror = reject;
-          reader.readAsDataURL(fileObj.file);
+      // Upload photos as multipart; the ticket only references the stored blobs
+      let photoIds = [];
+      if (selectedFiles.length > 0) {
+        const upload = new FormData();
+        selectedFiles.forEach(fileObj => upload.append('files', fileObj.file));
+        const uploadResponse = await axios.post(`${API}/tickets/attachments`, upload, {
+          headers: { Authorization: `Bearer ${token}` }
         });
-      });
+        photoIds = uploadResponse.data.map(blob => blob.blob_id);
+      }
 
-      const base64Photos = await Promise.all(photoPromises);
-
-      // Submit with base64 photos
       await axios.post(
         `${API}/tickets`,
         {
           ...formData,
-          photos: base64Photos
+          photos: photoIds
         },
         { headers: { Authorization: `Bearer ${token}` } }
       );
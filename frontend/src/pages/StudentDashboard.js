@@ -1,6 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { useAuth, API } from '../contexts/AuthContext';
+import { useEventStream } from '../hooks/use-event-stream';
 
 export default function StudentDashboard() {
   const navigate = useNavigate();
@@ -12,6 +13,11 @@ export default function StudentDashboard() {
     fetchMenus();
   }, []);
 
+  useEventStream({
+    'menu.published': () => fetchMenus(),
+    resync: () => fetchMenus()
+  });
+
   const fetchMenus = async () => {
     try {
       const response = await axios.get(`${API}/student/menus`, {
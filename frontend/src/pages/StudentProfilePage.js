@@ -25,9 +25,13 @@ export default function StudentProfilePage() {
         name: authUser.name || '',
         email: authUser.email || '',
         room_number: authUser.room_number || '',
-        profile_picture: authUser.profile_picture || ''
+        profile_picture: ''
       });
-      setPreviewImage(authUser.profile_picture || null);
+      setPreviewImage(
+        authUser.profile_picture_id
+          ? `${API}/media/profile-pictures/${authUser.profile_picture_id}?size=256`
+          : null
+      );
     }
   }, [authUser]);
 
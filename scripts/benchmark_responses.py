@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Compare list-endpoint serialisation before and after the orjson fast path
+on a synthetic dataset shaped like the stored documents.
+
+  default   jsonable_encoder + json.dumps (FastAPI's JSONResponse path)
+  validated TypeAdapter validation + jsonable_encoder + json.dumps
+            (what a response_model route does)
+  fast      fast_json(): orjson straight off the rows
+  strict    fast_json() with STRICT_RESPONSES validation
+
+With --url it instead times GET /api/admin/menus and /api/tickets over HTTP
+against a running server, logged in as the seeded admin. --seed N inserts N
+synthetic menus and tickets first (through backend/.env's database) and
+removes them afterwards; compare runs with STRICT_RESPONSES on and off.
+
+Usage (from the repo root, with backend/.env configured):
+    python scripts/benchmark_responses.py [--rows N] [--seconds S]
+    python scripts/benchmark_responses.py --url http://localhost:8000 [--seed N] [--seconds S]
+"""
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+import time
+import json
+import uuid
+import random
+import asyncio
+import statistics
+import http.client
+from urllib.parse import urlsplit
+from datetime import datetime, timezone, timedelta
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse
+import server
+from server import db, client, bump_versions, MENU_ITEMS_RESPONSE, MENUS_RESPONSE, TICKETS_RESPONSE, fast_json
+
+def seed_rows(count: int) -> dict:
+    now = datetime.now(timezone.utc)
+    item_ids = [str(uuid.uuid4()) for _ in range(40)]
+    menu_items = [{
+        'id': item_id,
+        'name': f"Item {i}",
+        'category': random.choice(['veg', 'non-veg']),
+        'meal_type': random.choice(['breakfast', 'lunch', 'dinner']),
+        'description': 'A reasonably long description of the dish ' * 2,
+        'created_at': now - timedelta(minutes=i)
+    } for i, item_id in enumerate(item_ids)] * (count // 40 or 1)
+    menus = [{
+        'id': str(uuid.uuid4()),
+        'date': (now - timedelta(days=i // 3)).strftime('%Y-%m-%d'),
+        'meal_type': ['breakfast', 'lunch', 'dinner'][i % 3],
+        'item_ids': random.sample(item_ids, 6),
+        'status': 'published',
+        'selection_start': now - timedelta(days=i // 3, hours=16),
+        'selection_end': now - timedelta(days=i // 3, hours=14),
+        'created_at': now - timedelta(days=i // 3)
+    } for i in range(count)]
+    tickets = [{
+        'id': str(uuid.uuid4()),
+        'user_id': str(uuid.uuid4()),
+        'category': random.choice(['Food Quality', 'Service', 'Hygiene', 'Billing', 'Other']),
+        'sub_category': None,
+        'urgency': random.choice(['basic', 'medium', 'critical']),
+        'description': 'The dal was cold and the rice undercooked again today. ' * 3,
+        'status': random.choice(['open', 'in_progress', 'closed']),
+        'created_at': now - timedelta(minutes=7 * i),
+        'photo_count': random.randint(0, 3),
+        'student_name': f"Student {i}",
+        'room_number': f"{100 + i % 300}"
+    } for i in range(count)]
+    return {'menu-items': (menu_items, MENU_ITEMS_RESPONSE), 'menus': (menus, MENUS_RESPONSE), 'tickets': (tickets, TICKETS_RESPONSE)}
+
+def default_path(rows, adapter):
+    return JSONResponse(jsonable_encoder(rows)).body
+
+def validated_path(rows, adapter):
+    return JSONResponse(jsonable_encoder(adapter.validate_python(rows))).body
+
+def fast_path(rows, adapter):
+    return fast_json(rows, adapter).body
+
+def strict_path(rows, adapter):
+    server.STRICT_RESPONSES = True
+    try:
+        return fast_json(rows, adapter).body
+    finally:
+        server.STRICT_RESPONSES = False
+
+PATHS = [('default', default_path), ('validated', validated_path), ('fast', fast_path), ('strict', strict_path)]
+
+def measure(fn, rows, adapter, seconds: float) -> float:
+    """Responses per second over roughly `seconds` of wall time."""
+    fn(rows, adapter)  # Warm up
+    runs = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        fn(rows, adapter)
+        runs += 1
+    return runs / (time.perf_counter() - start)
+
+def main(count: int, seconds: float):
+    print(f"Benchmarking list serialisation ({count} rows per response)...")
+    for route, (rows, adapter) in seed_rows(count).items():
+        size = len(fast_path(rows, adapter))
+        results = {name: measure(fn, rows, adapter, seconds) for name, fn in PATHS}
+        baseline = results['default']
+        print(f"\n/{route}  ({len(rows)} rows, {size / 1024:.0f} KiB)")
+        for name, rate in results.items():
+            print(f"  {name:<10} {rate:>9.1f} resp/s  {rate * len(rows):>11.0f} rows/s  {rate / baseline:>5.1f}x")
+
+HTTP_ROUTES = [('/api/admin/menus', None), ('/api/tickets', 'limit=200'), ('/api/tickets', 'limit=50')]
+
+async def seed_database(count: int) -> dict:
+    rows = seed_rows(count)
+    menus = [dict(menu) for menu in rows['menus'][0]]
+    tickets = [
+        {**{k: v for k, v in ticket.items() if k not in ('photo_count', 'student_name', 'room_number')}, 'photos': []}
+        for ticket in rows['tickets'][0]
+    ]
+    await db.menus.insert_many(menus)
+    await db.tickets.insert_many(tickets)
+    await bump_versions('menus', 'tickets')
+    return {'menus': [m['id'] for m in menus], 'tickets': [t['id'] for t in tickets]}
+
+async def unseed_database(seeded: dict):
+    await db.menus.delete_many({'id': {'$in': seeded['menus']}})
+    await db.tickets.delete_many({'id': {'$in': seeded['tickets']}})
+    await bump_versions('menus', 'tickets')
+
+def http_request(conn, method: str, path: str, body: bytes = None, headers: dict = None):
+    conn.request(method, path, body=body, headers=headers or {})
+    response = conn.getresponse()
+    return response.status, response.read()
+
+def http_main(url: str, seconds: float):
+    parts = urlsplit(url)
+    conn_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+    conn = conn_class(parts.netloc)
+    status, body = http_request(
+        conn, 'POST', '/api/auth/login',
+        json.dumps({'email': 'admin@hostel.com', 'password': 'admin123'}).encode(),
+        {'Content-Type': 'application/json'}
+    )
+    if status != 200:
+        print(f"✗ Admin login failed ({status})")
+        return 1
+    headers = {'Authorization': f"Bearer {json.loads(body)['token']}"}
+
+    print(f"Benchmarking {url} ({seconds:.0f}s per route, one keep-alive connection)...")
+    for path, query in HTTP_ROUTES:
+        target = f"{path}?{query}" if query else path
+        status, body = http_request(conn, 'GET', target, headers=headers)  # Warm up
+        if status != 200:
+            print(f"✗ {target}: {status}")
+            continue
+        rows = len(json.loads(body))
+        latencies = []
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            began = time.perf_counter()
+            http_request(conn, 'GET', target, headers=headers)
+            latencies.append((time.perf_counter() - began) * 1000)
+        elapsed = time.perf_counter() - start
+        p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+        print(f"  {target:<24} {rows:>5} rows {len(body) / 1024:>6.0f} KiB  "
+              f"{len(latencies) / elapsed:>7.1f} req/s  p50 {statistics.median(latencies):>6.1f}ms  p95 {p95:>6.1f}ms")
+    conn.close()
+    return 0
+
+async def run_http(url: str, seconds: float, seed: int) -> int:
+    seeded = await seed_database(seed) if seed else None
+    try:
+        return await asyncio.to_thread(http_main, url, seconds)
+    finally:
+        if seeded:
+            await unseed_database(seeded)
+        client.close()
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    count = int(args[args.index('--rows') + 1]) if '--rows' in args else 500
+    seconds = float(args[args.index('--seconds') + 1]) if '--seconds' in args else 2.0
+    if '--url' in args:
+        seed = int(args[args.index('--seed') + 1]) if '--seed' in args else 0
+        sys.exit(asyncio.run(run_http(args[args.index('--url') + 1], seconds, seed)))
+    main(count, seconds)
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Copy ticket attachments from the old local blob directory
+(<dir>/<id[:2]>/<id[2:4]>/<id>) into the GridFS attachment bucket.
+Blobs already in GridFS are skipped, so it is safe to re-run.
+
+Usage (from the repo root, with backend/.env configured):
+    python scripts/migrate_attachments.py [--source DIR]
+"""
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+import asyncio
+from server import db, client, blob_store, BLOB_ID_PATTERN
+
+async def migrate_attachments(source: Path):
+    print(f"Migrating attachments from {source}...")
+    copied = 0
+    present = 0
+    missing = 0
+
+    async for meta in db.attachments.find({}, {'_id': 1, 'content_type': 1}):
+        blob_id = meta['_id']
+        if not BLOB_ID_PATTERN.match(blob_id):
+            continue
+        if await blob_store.files.find_one({'filename': blob_id}, {'_id': 1}):
+            present += 1
+            continue
+        path = source / blob_id[:2] / blob_id[2:4] / blob_id
+        if not path.exists():
+            print(f"✗ {blob_id}: not found under {source}")
+            missing += 1
+            continue
+        await blob_store.bucket.upload_from_stream(
+            blob_id,
+            path.read_bytes(),
+            metadata={'content_type': meta.get('content_type', 'application/octet-stream')}
+        )
+        copied += 1
+
+    print(f"✓ {copied} attachments copied, {present} already in GridFS, {missing} missing")
+    client.close()
+    return 1 if missing else 0
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    default = Path(__file__).resolve().parent.parent / 'backend' / 'blobs'
+    source = Path(args[args.index('--source') + 1]) if '--source' in args else default
+    sys.exit(asyncio.run(migrate_attachments(source)))
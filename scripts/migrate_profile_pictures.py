@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Move legacy inline base64 profile pictures out of the users collection
+and into the GridFS media store used by /api/media/profile-pictures.
+
+Running API processes cache authenticated users for PRINCIPAL_CACHE_TTL
+seconds (300 by default), and this script can't reach those caches. Users
+already signed in keep their old profile until the entry expires. Restart
+the API to pick up the change at once.
+
+Usage (from the repo root, with backend/.env configured):
+    python scripts/migrate_profile_pictures.py
+"""
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+import asyncio
+from fastapi import HTTPException
+from server import db, client, store_profile_picture
+
+async def migrate_profile_pictures():
+    print("Migrating profile pictures...")
+    moved = 0
+    failed = 0
+
+    cursor = db.users.find(
+        {'profile_picture': {'$nin': [None, '']}},
+        {'_id': 0, 'id': 1, 'profile_picture': 1}
+    )
+    async for user in cursor:
+        try:
+            digest = await store_profile_picture(user['profile_picture'])
+        except HTTPException as e:
+            print(f"✗ {user['id']}: {e.detail}")
+            failed += 1
+            continue
+        await db.users.update_one(
+            {'id': user['id']},
+            {'$set': {'profile_picture_id': digest}, '$unset': {'profile_picture': ''}}
+        )
+        moved += 1
+
+    print(f"✓ {moved} profile pictures moved, {failed} skipped")
+    client.close()
+
+if __name__ == '__main__':
+    asyncio.run(migrate_profile_pictures())
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Convert ISO-8601 string timestamps to native BSON dates, in batches.
+
+Covers every field listed in server.TIMESTAMP_FIELDS. Safe to re-run and
+to run while the API is serving: each update only applies if the field
+still holds the string that was read.
+
+Usage (from the repo root, with backend/.env configured):
+    python scripts/migrate_timestamps.py [--dry-run] [--batch-size N]
+"""
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+import asyncio
+from pymongo import UpdateOne
+from server import db, client, TIMESTAMP_FIELDS, parse_timestamp
+
+async def migrate_field(collection: str, field: str, batch_size: int, dry_run: bool):
+    converted = 0
+    failed = 0
+    last_id = None
+    while True:
+        query = {field: {'$type': 'string'}}
+        if last_id is not None:
+            query['_id'] = {'$gt': last_id}
+        docs = await db[collection].find(query, {field: 1}).sort('_id', 1).limit(batch_size).to_list(batch_size)
+        if not docs:
+            break
+        last_id = docs[-1]['_id']
+
+        operations = []
+        for doc in docs:
+            try:
+                value = parse_timestamp(doc[field])
+            except ValueError:
+                print(f"✗ {collection}.{field} {doc['_id']}: unparseable {doc[field]!r}")
+                failed += 1
+                continue
+            operations.append(UpdateOne({'_id': doc['_id'], field: doc[field]}, {'$set': {field: value}}))
+        if operations and not dry_run:
+            result = await db[collection].bulk_write(operations, ordered=False)
+            converted += result.modified_count
+        else:
+            converted += len(operations)
+    return converted, failed
+
+async def migrate_timestamps(batch_size: int, dry_run: bool) -> int:
+    print("Migrating timestamps to BSON dates..." + (" (dry run)" if dry_run else ""))
+    total_failed = 0
+    for collection, fields in TIMESTAMP_FIELDS.items():
+        for field in fields:
+            converted, failed = await migrate_field(collection, field, batch_size, dry_run)
+            total_failed += failed
+            print(f"✓ {collection}.{field}: {converted} converted, {failed} skipped")
+
+    client.close()
+    return 1 if total_failed else 0
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    dry_run = '--dry-run' in args
+    batch_size = int(args[args.index('--batch-size') + 1]) if '--batch-size' in args else 1000
+    sys.exit(asyncio.run(migrate_timestamps(batch_size, dry_run)))
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Rebuild menu_counters from raw user_selections and report drift.
+
+Usage (from the repo root, with backend/.env configured):
+    python scripts/reconcile_counters.py [--dry-run] [menu_id ...]
+"""
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+import asyncio
+from server import client, reconcile_menu_counters
+
+async def reconcile(menu_ids, dry_run: bool) -> int:
+    print("Reconciling menu counters..." + (" (dry run)" if dry_run else ""))
+    report = await reconcile_menu_counters(menu_ids or None, dry_run=dry_run)
+
+    drifted = 0
+    for entry in report:
+        if entry['total_users_drift'] or entry['item_drift']:
+            drifted += 1
+            print(f"✗ {entry['menu_id']}: total_users {entry['total_users_drift']:+d}, items {entry['item_drift']}")
+        else:
+            print(f"✓ {entry['menu_id']}")
+
+    client.close()
+    action = "found" if dry_run else "repaired"
+    print(f"\n{drifted} of {len(report)} menus drifted ({action})")
+    return 1 if dry_run and drifted else 0
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    dry_run = '--dry-run' in args
+    menu_ids = [arg for arg in args if arg != '--dry-run']
+    sys.exit(asyncio.run(reconcile(menu_ids, dry_run)))
@@ -30,7 +30,7 @@ async def seed_database():
             'password_hash': hash_password('admin123'),
             'name': 'Admin User',
             'role': 'admin',
-            'created_at': datetime.now(timezone.utc).isoformat()
+            'created_at': datetime.now(timezone.utc)
         }
         await db.users.insert_one(admin)
         print("✓ Admin user created (admin@hostel.com / admin123)")
@@ -45,7 +45,7 @@ async def seed_database():
             'name': 'John Doe',
             'role': 'student',
             'hostel_id': 'H-101',
-            'created_at': datetime.now(timezone.utc).isoformat()
+            'created_at': datetime.now(timezone.utc)
         }
 
         await db.users.insert_one(student)
@@ -76,7 +76,7 @@ async def seed_database():
     for item in items:
         exists = await db.menu_items.find_one({'id': item['id']})
         if not exists:
-            item['created_at'] = datetime.now(timezone.utc).isoformat()
+            item['created_at'] = datetime.now(timezone.utc)
             await db.menu_items.insert_one(item)
     print(f"✓ {len(items)} menu items created")
     
@@ -92,9 +92,9 @@ async def seed_database():
             'meal_type': 'breakfast',
             'item_ids': ['item-b1', 'item-b2', 'item-b3', 'item-b4'],
             'status': 'published',
-            'selection_start': (today - timedelta(days=1)).replace(hour=20, minute=0).isoformat(),
-            'selection_end': (today - timedelta(days=1)).replace(hour=21, minute=30).isoformat(),
-            'created_at': datetime.now(timezone.utc).isoformat()
+            'selection_start': (today - timedelta(days=1)).replace(hour=20, minute=0),
+            'selection_end': (today - timedelta(days=1)).replace(hour=21, minute=30),
+            'created_at': datetime.now(timezone.utc)
         },
 
         {
@@ -103,9 +103,9 @@ async def seed_database():
             'meal_type': 'lunch',
             'item_ids': ['item-l1', 'item-l2', 'item-l3', 'item-l4', 'item-l5'],
             'status': 'published',
-            'selection_start': today.replace(hour=8, minute=0).isoformat(),
-            'selection_end': today.replace(hour=9, minute=30).isoformat(),
-            'created_at': datetime.now(timezone.utc).isoformat()
+            'selection_start': today.replace(hour=8, minute=0),
+            'selection_end': today.replace(hour=9, minute=30),
+            'created_at': datetime.now(timezone.utc)
         },
         {
             'id': 'menu-today-dinner',
@@ -113,9 +113,9 @@ async def seed_database():
             'meal_type': 'dinner',
             'item_ids': ['item-d1', 'item-d2', 'item-d3', 'item-d4', 'item-d5'],
             'status': 'published',
-            'selection_start': today.replace(hour=11, minute=30).isoformat(),
-            'selection_end': today.replace(hour=14, minute=0).isoformat(),
-            'created_at': datetime.now(timezone.utc).isoformat()
+            'selection_start': today.replace(hour=11, minute=30),
+            'selection_end': today.replace(hour=14, minute=0),
+            'created_at': datetime.now(timezone.utc)
         },
         {
             'id': 'menu-tomorrow-breakfast',
@@ -123,15 +123,16 @@ async def seed_database():
             'meal_type': 'breakfast',
             'item_ids': ['item-b1', 'item-b2', 'item-b3', 'item-b4'],
             'status': 'published',
-            'selection_start': today.replace(hour=20, minute=0).isoformat(),
-            'selection_end': today.replace(hour=21, minute=30).isoformat(),
-            'created_at': datetime.now(timezone.utc).isoformat()
+            'selection_start': today.replace(hour=20, minute=0),
+            'selection_end': today.replace(hour=21, minute=30),
+            'created_at': datetime.now(timezone.utc)
         }
     ]
     
     for menu in menus:
         exists = await db.menus.find_one({'id': menu['id']})
         if not exists:
+            await db.menu_counters.update_one({'_id': menu['id']}, {'$setOnInsert': {'total_users': 0, 'items': {}}}, upsert=True)
             await db.menus.insert_one(menu)
     print(f"✓ {len(menus)} menus created")
     client.close()
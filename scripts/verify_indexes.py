@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Apply the server's index registry and verify every registered route query
+is served by an index. Exits non-zero if any index could not be built or
+any query plan contains a COLLSCAN.
+
+A unique index blocked by existing duplicates is reported with examples.
+Duplicate (user_id, menu_id) selections can be collapsed with --dedupe
+(keeps the newest, rebuilds counters); other duplicates, such as repeated
+emails, need manual cleanup.
+
+Usage (from the repo root, with backend/.env configured):
+    python scripts/verify_indexes.py [--dedupe] [--dry-run]
+"""
+import sys
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+import asyncio
+from server import client, ensure_indexes, explain_query, dedupe_selections, QUERY_PLAN_CHECKS
+
+async def verify_indexes(dedupe: bool, dry_run: bool) -> int:
+    if dedupe:
+        print("Deduplicating selections..." + (" (dry run)" if dry_run else ""))
+        result = await dedupe_selections(dry_run=dry_run)
+        print(f"✓ {result['duplicate_keys']} duplicated (user_id, menu_id) keys, "
+              f"{result['removed']} documents {'to remove' if dry_run else 'removed'}\n")
+
+    print("Ensuring indexes...")
+    index_failures = 0
+    report = await ensure_indexes()
+    for collection, indexes in report.items():
+        for name, status in indexes.items():
+            if status == 'ok':
+                print(f"✓ {collection}.{name}")
+            else:
+                index_failures += 1
+                print(f"✗ {collection}.{name}: {status}")
+
+    print("\nExplaining route queries...")
+    failures = 0
+    for check in QUERY_PLAN_CHECKS:
+        plan = await explain_query(check['collection'], check['filter'], check.get('sort'))
+        stages = ' -> '.join(plan['stages'])
+        if 'COLLSCAN' in plan['stages']:
+            failures += 1
+            print(f"✗ {check['route']} [{check['collection']}] {check['filter']}: {stages}")
+        else:
+            print(f"✓ {check['route']} [{check['collection']}]: {stages}")
+
+    client.close()
+    if index_failures:
+        print(f"\n❌ {index_failures} indexes could not be created")
+    if failures:
+        print(f"\n❌ {failures} queries fall back to COLLSCAN")
+    if index_failures or failures:
+        return 1
+    print(f"\n✅ All {len(QUERY_PLAN_CHECKS)} queries use indexes")
+    return 0
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    sys.exit(asyncio.run(verify_indexes('--dedupe' in args, '--dry-run' in args)))